@@ -0,0 +1,63 @@
+# Throughput of one KVServer as the number of concurrent clients grows.
+#
+#   python -m benchmarks.kv_scaling [seconds-per-run]
+#
+# Each client owns a few keys and issues a 1:1 mix of Append and Get on
+# them. The run is repeated with a single lock stripe (the old one-lock
+# server) and with the default striping, on a make_single_config cluster.
+
+import sys
+import threading
+import time
+import unittest
+
+from config import Config
+from storage import NPARTITIONS
+
+CLIENTS = [1, 2, 4, 8, 16]
+KEYS_PER_CLIENT = 4
+
+def run(nclients: int, npartitions: int, seconds: float) -> float:
+    # make_single_config, with the stripe count set before the server starts
+    cfg = Config(unittest.TestCase())
+    cfg.npartitions = npartitions
+    cfg.start_cluster(1)
+    cfg.net.reliable(True)
+    try:
+        done = threading.Event()
+        counts = [0] * nclients
+
+        def client(cli):
+            ck = cfg.make_client()
+            keys = [f"{cli}-{i}" for i in range(KEYS_PER_CLIENT)]
+            n = 0
+            while not done.is_set():
+                key = keys[n % len(keys)]
+                if n % 2 == 0:
+                    ck.append(key, "x")
+                else:
+                    ck.get(key)
+                n += 1
+            counts[cli] = n
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(nclients)]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        done.set()
+        for t in threads:
+            t.join()
+        return sum(counts) / seconds
+    finally:
+        cfg.cleanup()
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    print(f"{'clients':>8} {'1 stripe ops/s':>16} {f'{NPARTITIONS} stripes ops/s':>18}")
+    for nclients in CLIENTS:
+        one = run(nclients, 1, seconds)
+        many = run(nclients, NPARTITIONS, seconds)
+        print(f"{nclients:>8} {one:>16.0f} {many:>18.0f}")
+
+if __name__ == "__main__":
+    main()
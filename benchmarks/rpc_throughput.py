@@ -0,0 +1,81 @@
+# RPC throughput of labrpc.Network with its worker pools versus the old
+# design, which started a thread per request plus one per handler call.
+#
+#   python -m benchmarks.rpc_throughput [seconds-per-run]
+#
+# Clients call a trivial handler over a reliable network, so the numbers
+# measure the network's scheduling rather than the server.
+
+import queue
+import sys
+import threading
+import time
+
+from labrpc.labrpc import Network, Server, Service
+
+CLIENTS = [1, 8, 64, 256]
+
+class EchoServer:
+    def echo(self, args):
+        return args
+
+# Network as it was before the worker pools, for comparison.
+class ThreadPerRequestNetwork(Network):
+    def process_req(self, req):
+        threading.Thread(target=self.serve, args=(req,), daemon=True).start()
+
+    def serve(self, req):
+        enabled, servername, server, isreliable, long_reordering = self.read_endname_info(req.endname)
+        ech = queue.Queue()
+        threading.Thread(target=lambda: ech.put(server.dispatch(req)), daemon=True).start()
+        while True:
+            try:
+                req.replyCh.put(ech.get(timeout=0.1))
+                return
+            except queue.Empty:
+                if self.is_server_dead(req.endname, servername, server):
+                    return
+
+def run(net_cls, nclients: int, seconds: float) -> float:
+    rn = net_cls()
+    try:
+        rs = Server()
+        rs.add_service(Service(EchoServer()))
+        rn.add_server("echo", rs)
+        ends = []
+        for i in range(nclients):
+            ends.append(rn.make_end(i))
+            rn.connect(i, "echo")
+            rn.enable(i, True)
+
+        done = threading.Event()
+        counts = [0] * nclients
+
+        def client(me):
+            n = 0
+            while not done.is_set():
+                ends[me].call("EchoServer.echo", str(n))
+                n += 1
+            counts[me] = n
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(nclients)]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        done.set()
+        for t in threads:
+            t.join()
+        return sum(counts) / seconds
+    finally:
+        rn.cleanup()
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    print(f"{'clients':>8} {'thread/req RPC/s':>17} {'pooled RPC/s':>13}")
+    for nclients in CLIENTS:
+        old = run(ThreadPerRequestNetwork, nclients, seconds)
+        new = run(Network, nclients, seconds)
+        print(f"{nclients:>8} {old:>17.0f} {new:>13.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Write throughput of a persistent KVServer with group commit versus an
+# fsync per operation.
+#
+#   python -m benchmarks.wal_commit [seconds-per-run]
+#
+# Writer threads call KVServer.Put directly, so the numbers measure the
+# log rather than labrpc.
+
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from config import Config
+from server import PutAppendArgs
+
+WRITERS = [1, 4, 16, 64]
+
+def run(nwriters: int, group_commit: bool, seconds: float):
+    with tempfile.TemporaryDirectory() as d:
+        cfg = Config(unittest.TestCase())
+        cfg.persist_dir = d
+        cfg.group_commit = group_commit
+        cfg.start_cluster(1)
+        kv = cfg.kvservers[0]
+        try:
+            done = threading.Event()
+            counts = [0] * nwriters
+
+            def writer(me):
+                n = 0
+                while not done.is_set():
+                    n += 1
+                    kv.Put(PutAppendArgs(f"k{me}", "v" * 100, me + 1, n, n - 1))
+                counts[me] = n
+
+            threads = [threading.Thread(target=writer, args=(i,)) for i in range(nwriters)]
+            for t in threads:
+                t.start()
+            time.sleep(seconds)
+            done.set()
+            for t in threads:
+                t.join()
+            nops = sum(counts)
+            return nops / seconds, nops / max(kv.wal.nsyncs, 1)
+        finally:
+            cfg.cleanup()
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    print(f"{'writers':>8} {'fsync/op ops/s':>15} {'group ops/s':>12} {'ops/fsync':>10}")
+    for nwriters in WRITERS:
+        single, _ = run(nwriters, False, seconds)
+        group, per_sync = run(nwriters, True, seconds)
+        print(f"{nwriters:>8} {single:>15.0f} {group:>12.0f} {per_sync:>10.1f}")
+
+if __name__ == "__main__":
+    main()
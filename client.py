@@ -1,19 +1,140 @@
+import asyncio
+import concurrent.futures
 import random
 import threading
-from typing import Any, List
+import time
+import zlib
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
 
 from labrpc.labrpc import ClientEnd
-from server import GetArgs, GetReply, PutAppendArgs, PutAppendReply
+from server import GetArgs, GetReply, PutAppendArgs, PutAppendReply, OK
+from server import MultiGetArgs, MultiPutAppendArgs
+from shardmap import ShardMap, get_shardmap
 
 def nrand() -> int:
     return random.getrandbits(62)
 
+# Raised when every server in a key's group refuses the key; with a static
+# shard configuration retrying cannot help.
+class WrongGroupError(Exception):
+    pass
+
+# What append_compact reports about the value before the append.
+class AppendResult:
+    def __init__(self, prev_len: int, prev_crc, tail: str):
+        self.prev_len = prev_len
+        self.prev_crc = prev_crc  # CRC-32 of the UTF-8 value, or None if not asked for
+        self.tail = tail
+
+# A stream of writes that servers deduplicate together: a client id and the
+# last sequence number used. The servers only remember a client's latest
+# request, so a session has at most one write in flight.
+class Session:
+    def __init__(self):
+        self.mu = threading.Lock()
+        self.client_id = nrand()
+        self.seq = 0
+
+# Hedged reads: a replica that has not answered within the HEDGE_PERCENTILE
+# of its recent latencies (the last HEDGE_WINDOW successful RPCs) gets
+# company from another replica. Servers with no samples yet are assumed to
+# take HEDGE_DEFAULT; deadlines are never shorter than HEDGE_MIN.
+HEDGE_PERCENTILE = 0.95
+HEDGE_WINDOW = 64
+HEDGE_DEFAULT = 0.05
+HEDGE_MIN = 0.002
+
+# Recent RPC latencies per server, in seconds.
+class LatencyTracker:
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self.mu = threading.Lock()
+        self.window = window
+        self.samples: Dict[int, deque] = {}
+        self.cache: Dict[int, Tuple[float, float]] = {}  # server -> (p50, p95)
+
+    def record(self, srv: int, seconds: float):
+        with self.mu:
+            q = self.samples.get(srv)
+            if q is None:
+                q = deque(maxlen=self.window)
+                self.samples[srv] = q
+            q.append(seconds)
+            self.cache.pop(srv, None)
+
+    def percentiles(self, srv: int) -> Tuple[float, float]:
+        with self.mu:
+            p = self.cache.get(srv)
+            if p is None:
+                q = self.samples.get(srv)
+                if not q:
+                    return HEDGE_DEFAULT, HEDGE_DEFAULT
+                xs = sorted(q)
+                p = (xs[len(xs) // 2], xs[min(int(len(xs) * HEDGE_PERCENTILE), len(xs) - 1)])
+                self.cache[srv] = p
+            return p
+
+    # How long to wait for srv before hedging.
+    def deadline(self, srv: int) -> float:
+        return max(self.percentiles(srv)[1], HEDGE_MIN)
+
+    # servers ordered by median latency; ties keep their order
+    def rank(self, servers) -> List[int]:
+        return sorted(servers, key=lambda srv: self.percentiles(srv)[0])
+
 class Clerk:
     def __init__(self, servers: List[ClientEnd], cfg):
         self.servers = servers
         self.cfg = cfg
 
         # Your definitions here.
+        self.mu = threading.Lock()
+        self.sessions: Dict[int, Session] = {}  # one per shard; guarded by mu
+        self.latency = LatencyTracker()
+        self.nreads = 0  # Gets sent to a replica group; guarded by mu
+        self.nhedges = 0  # extra RPCs sent by hedged reads; guarded by mu
+
+    def shardmap(self) -> ShardMap:
+        return get_shardmap(len(self.servers), self.cfg.nreplicas)
+
+    def shard(self, key: str) -> int:
+        return self.shardmap().shard(key)
+
+    # The servers that may hold key, primary first.
+    def group(self, key: str) -> Tuple[int, ...]:
+        return self.shardmap().group(key)
+
+    # Writes to different shards use different sessions, so batches can
+    # update several shards in parallel.
+    def session(self, shard: int) -> Session:
+        with self.mu:
+            sess = self.sessions.get(shard)
+            if sess is None:
+                sess = Session()
+                self.sessions[shard] = sess
+            return sess
+
+    # Send args to key's group until some server answers. Failed RPCs move
+    # on to the next replica; a server that does not own the key is not
+    # asked again.
+    def call(self, key: str, svc_meth: str, args):
+        group = self.group(key)
+        rejected = set()
+        i = 0
+        while True:
+            srv = group[i % len(group)]
+            i += 1
+            if srv in rejected:
+                continue
+            try:
+                reply = self.servers[srv].call(svc_meth, args)
+            except TimeoutError:
+                continue
+            if reply.err == OK:
+                return reply
+            rejected.add(srv)
+            if len(rejected) == len(group):
+                raise WrongGroupError(f"{svc_meth}({key!r}): rejected by servers {sorted(rejected)}")
 
     # Fetch the current value for a key.
     # Returns "" if the key does not exist.
@@ -27,8 +148,65 @@ class Clerk:
     # must match the declared types of the RPC handler function's
     # arguments in server.py.
     def get(self, key: str) -> str:
-        # You will have to modify this function.
-        return ""
+        if len(self.group(key)) > 1:
+            reply = self.hedged_call(key, "KVServer.Get", GetArgs(key))
+        else:
+            reply = self.call(key, "KVServer.Get", GetArgs(key))
+        return reply.value or ""
+
+    # Like call, for reads: send args to the replica expected to be fastest
+    # and, each time the latest replica tried misses its deadline, also to
+    # the next one. The first valid reply wins; the others are ignored.
+    def hedged_call(self, key: str, svc_meth: str, args):
+        group = self.latency.rank(self.group(key))
+        rejected = set()
+        pending = {}  # future -> (server, start time)
+        i = 0
+
+        def launch():
+            nonlocal i
+            busy = {srv for srv, _ in pending.values()}
+            for _ in range(len(group)):
+                srv = group[i % len(group)]
+                i += 1
+                if srv not in rejected and srv not in busy:
+                    fut = self.servers[srv].call_async(svc_meth, args)
+                    pending[fut] = (srv, time.monotonic())
+                    return srv
+            return None
+
+        with self.mu:
+            self.nreads += 1
+        last = launch()
+        while True:
+            timeout = self.latency.deadline(last) if last is not None else None
+            done, _ = concurrent.futures.wait(list(pending), timeout, concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                last = launch()
+                if last is not None:
+                    with self.mu:
+                        self.nhedges += 1
+                continue
+
+            for fut in done:
+                srv, start = pending.pop(fut)
+                try:
+                    reply = fut.result()
+                except TimeoutError:
+                    continue
+                self.latency.record(srv, time.monotonic() - start)
+                if reply.err == OK:
+                    return reply
+                rejected.add(srv)
+            if len(rejected) == len(group):
+                raise WrongGroupError(f"{svc_meth}({key!r}): rejected by servers {sorted(rejected)}")
+            if not pending:
+                last = launch()
+
+    # Fraction of replicated reads that needed a hedge RPC.
+    def hedge_rate(self) -> float:
+        with self.mu:
+            return self.nhedges / self.nreads if self.nreads else 0.0
 
     # Shared by Put and Append.
     #
@@ -40,8 +218,19 @@ class Clerk:
     # must match the declared types of the RPC handler function's
     # arguments in server.py.
     def put_append(self, key: str, value: str, op: str) -> str:
-        # You will have to modify this function.
-        return ""
+        reply = self.write(key, "KVServer." + op, PutAppendArgs(key, value))
+        return reply.value or ""
+
+    # Send a Put/Append-style request for key's shard under that shard's
+    # session.
+    def write(self, key: str, svc_meth: str, args):
+        sess = self.session(self.shard(key))
+        with sess.mu:
+            args.ack = sess.seq
+            sess.seq += 1
+            args.client_id = sess.client_id
+            args.seq = sess.seq
+            return self.call(key, svc_meth, args)
 
     def put(self, key: str, value: str):
         self.put_append(key, value, "Put")
@@ -49,3 +238,156 @@ class Clerk:
     # Append value to key's value and return that value
     def append(self, key: str, value: str) -> str:
         return self.put_append(key, value, "Append")
+
+    # Append value to key's value without transferring the old value back.
+    # The result carries its length, its last tail characters and, if crc
+    # is set, its CRC-32.
+    def append_compact(self, key: str, value: str, tail: int = 0, crc: bool = False) -> AppendResult:
+        args = PutAppendArgs(key, value, compact=True, tail=tail, crc=crc)
+        reply = self.write(key, "KVServer.Append", args)
+        return AppendResult(reply.prev_len, reply.prev_crc if crc else None, reply.value or "")
+
+    # Fetch the values of several keys with one RPC per shard.
+    def get_many(self, keys: List[str]) -> List[str]:
+        values = [""] * len(keys)
+
+        def get_shard(idxs: List[int]):
+            args = MultiGetArgs([keys[i] for i in idxs])
+            reply = self.call(args.keys[0], "KVServer.MultiGet", args)
+            for i, v in zip(idxs, reply.values):
+                values[i] = v or ""
+
+        self.for_each_shard(keys, get_shard)
+        return values
+
+    def put_many(self, items: Union[Dict[str, str], Iterable[Tuple[str, str]]]):
+        self.put_append_many(items, "Put")
+
+    # Apply the appends in order and return each key's previous value.
+    def append_many(self, items: Union[Dict[str, str], Iterable[Tuple[str, str]]]) -> List[str]:
+        return self.put_append_many(items, "Append")
+
+    # Shared by put_many and append_many. Writes to one key keep their
+    # relative order; writes to different shards are not atomic together.
+    def put_append_many(self, items, op: str) -> List[str]:
+        items = list(items.items()) if isinstance(items, dict) else list(items)
+        keys = [key for key, _ in items]
+        olds = [""] * len(items)
+
+        def write_shard(idxs: List[int]):
+            args = MultiPutAppendArgs([keys[i] for i in idxs], [items[i][1] for i in idxs])
+            reply = self.write(args.keys[0], "KVServer.Multi" + op, args)
+            if reply.values is not None:
+                for i, v in zip(idxs, reply.values):
+                    olds[i] = v or ""
+
+        self.for_each_shard(keys, write_shard)
+        return olds
+
+    # Call fn with the indexes of keys that fall in each shard, one thread
+    # per shard.
+    def for_each_shard(self, keys: List[str], fn: Callable[[List[int]], None]):
+        byshard = defaultdict(list)
+        for i, key in enumerate(keys):
+            byshard[self.shard(key)].append(i)
+        pieces = list(byshard.values())
+        if len(pieces) <= 1:
+            for idxs in pieces:
+                fn(idxs)
+            return
+
+        errors = []
+
+        def run(idxs):
+            try:
+                fn(idxs)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(idxs,), daemon=True) for idxs in pieces]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if errors:
+            raise errors[0]
+
+# Number of lanes in an AsyncClerk. Each lane is a Session with at most one
+# request in flight, so this bounds one AsyncClerk's outstanding requests.
+NLANES = 1024
+
+# A Clerk whose get/put/append are coroutines. Many operations can be
+# outstanding at once: keys hash to lanes, each lane runs its operations one
+# at a time in the order they were issued, and each lane writes under its
+# own Session. Operations on one key therefore stay in order and at most
+# once, while operations on keys in different lanes overlap.
+class AsyncClerk:
+    def __init__(self, servers: List[ClientEnd], cfg, nlanes: int = NLANES):
+        self.servers = servers
+        self.cfg = cfg
+        self.nlanes = nlanes
+        self.lanes: Dict[int, Tuple[asyncio.Lock, Session]] = {}
+
+    def shardmap(self) -> ShardMap:
+        return get_shardmap(len(self.servers), self.cfg.nreplicas)
+
+    def group(self, key: str) -> Tuple[int, ...]:
+        return self.shardmap().group(key)
+
+    def lane(self, key: str) -> Tuple[asyncio.Lock, Session]:
+        i = zlib.crc32(key.encode("utf-8", "surrogatepass")) % self.nlanes
+        lane = self.lanes.get(i)
+        if lane is None:
+            lane = (asyncio.Lock(), Session())
+            self.lanes[i] = lane
+        return lane
+
+    # Clerk.call, without blocking the event loop.
+    async def call(self, key: str, svc_meth: str, args):
+        group = self.group(key)
+        rejected = set()
+        i = 0
+        while True:
+            srv = group[i % len(group)]
+            i += 1
+            if srv in rejected:
+                continue
+            try:
+                reply = await asyncio.wrap_future(self.servers[srv].call_async(svc_meth, args))
+            except TimeoutError:
+                continue
+            if reply.err == OK:
+                return reply
+            rejected.add(srv)
+            if len(rejected) == len(group):
+                raise WrongGroupError(f"{svc_meth}({key!r}): rejected by servers {sorted(rejected)}")
+
+    async def get(self, key: str) -> str:
+        mu, _ = self.lane(key)
+        async with mu:
+            reply = await self.call(key, "KVServer.Get", GetArgs(key))
+        return reply.value or ""
+
+    async def put_append(self, key: str, value: str, op: str) -> str:
+        reply = await self.write(key, "KVServer." + op, PutAppendArgs(key, value))
+        return reply.value or ""
+
+    async def write(self, key: str, svc_meth: str, args):
+        mu, sess = self.lane(key)
+        async with mu:
+            args.ack = sess.seq
+            sess.seq += 1
+            args.client_id = sess.client_id
+            args.seq = sess.seq
+            return await self.call(key, svc_meth, args)
+
+    async def put(self, key: str, value: str):
+        await self.put_append(key, value, "Put")
+
+    async def append(self, key: str, value: str) -> str:
+        return await self.put_append(key, value, "Append")
+
+    async def append_compact(self, key: str, value: str, tail: int = 0, crc: bool = False) -> AppendResult:
+        args = PutAppendArgs(key, value, compact=True, tail=tail, crc=crc)
+        reply = await self.write(key, "KVServer.Append", args)
+        return AppendResult(reply.prev_len, reply.prev_crc if crc else None, reply.value or "")
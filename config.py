@@ -10,6 +10,7 @@ import base64
 from labrpc.labrpc import Network, Service, Server
 from client import Clerk
 from server import KVServer
+from storage import NPARTITIONS
 
 def randstring(n):
     b = os.urandom(2 * n)
@@ -35,18 +36,25 @@ class Config:
         self.rpcs0 = 0
         self.ops = 0
         self.nreplicas = 1
+        self.npartitions = NPARTITIONS  # lock stripes per KVServer
+        self.persist_dir = None  # directory for KVServer logs; None keeps servers in memory
+        self.group_commit = True  # share fsyncs between concurrent writes
+        self.snapshot_bytes = None  # snapshot once a server's log reaches this size
 
     def cleanup(self):
         with self.mu:
             self.net.cleanup()
+            for kv in self.kvservers or []:
+                kv.kill()
 
-    def make_client(self):
+    # cls is Clerk or AsyncClerk
+    def make_client(self, cls=Clerk):
         with self.mu:
             endnames = [randstring(20) for i in range(self.nservers)]
             ends = [self.net.make_end(endname) for endname in endnames]
             for srvid in range(self.nservers):
                 self.net.connect(endnames[srvid], srvid)
-            ck = Clerk(ends, self)
+            ck = cls(ends, self)
             self.clerks[ck] = endnames
             self.connect_client_unlocked(ck)
         return ck
@@ -70,13 +78,24 @@ class Config:
         self.nservers = nservers
         self.kvservers = [None] * nservers
         for srvid in range(nservers):
-            self.kvservers[srvid] = KVServer(self)
-            kvsvc = Service(self.kvservers[srvid])
-            srv = Server()
-            srv.add_service(kvsvc)
-            self.net.add_server(srvid, srv)
+            self.start_kvserver(srvid)
             self.running_servers.add(srvid)
 
+    def start_kvserver(self, srvid):
+        self.kvservers[srvid] = KVServer(self, srvid)
+        kvsvc = Service(self.kvservers[srvid])
+        srv = Server()
+        srv.add_service(kvsvc)
+        self.net.add_server(srvid, srv)
+
+    # Crash server srvid and start a fresh KVServer in its place, which
+    # recovers from its log if persist_dir is set.
+    def restart_server(self, srvid):
+        with self.mu:
+            self.net.delete_server(srvid)
+            self.kvservers[srvid].kill()
+            self.start_kvserver(srvid)
+
     def stop_server(self, srvid):
         with self.mu:
             if srvid not in self.running_servers:
@@ -120,18 +139,20 @@ class Config:
             print("  ... Passed --")
             print(f" t {t} nrpc {nrpc} ops {ops}\n")
 
-def make_single_config(t, unreliable):
+def make_single_config(t, unreliable, persist_dir=None):
     cfg = Config(t)
     cfg.clerks = {}
     cfg.start = time.time()
+    cfg.persist_dir = persist_dir
     cfg.start_cluster(1)
     cfg.net.reliable(not unreliable)
     return cfg
 
-def make_shard_config(t, nshards, nreplicas, unreliable):
+def make_shard_config(t, nshards, nreplicas, unreliable, persist_dir=None):
     cfg = Config(t)
     cfg.clerks = {}
     cfg.start = time.time()
+    cfg.persist_dir = persist_dir
     cfg.start_cluster(nshards)
     cfg.nreplicas = nreplicas
     cfg.net.reliable(not unreliable)
@@ -0,0 +1,141 @@
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+# Clients that send nothing for this many seconds are forgotten. A request
+# retried after that would execute again, so this must be much longer than
+# any retry loop.
+CLIENT_TTL = 300.0
+
+# Stripes in a DuplicateTable; a client id always maps to the same stripe.
+NSTRIPES = 16
+
+# Each stripe looks for idle clients after this many records.
+SWEEP_INTERVAL = 1024
+
+class DupEntry:
+    __slots__ = ("seq", "reply", "size", "last_seen")
+
+    def __init__(self, seq: int, reply: Any, size: int, last_seen: float):
+        self.seq = seq  # latest executed request from this client
+        self.reply = reply  # its reply, or None once the client has acked it
+        self.size = size  # estimated bytes held by reply
+        self.last_seen = last_seen
+
+class DupStripe:
+    def __init__(self):
+        self.mu = threading.Lock()
+        self.entries: Dict[int, DupEntry] = {}
+        self.nbytes = 0  # sum of entries' size
+        self.nrecords = 0
+
+# At-most-once bookkeeping for Put/Append. For each client id (Clerk.client_id)
+# the table keeps only the sequence number and reply of its latest executed
+# request. A client's requests carry the highest sequence number whose reply
+# it has received (its ack); once that covers the latest request, the cached
+# reply is dropped and only the sequence number is kept. Clients idle for
+# longer than ttl are removed altogether.
+class DuplicateTable:
+    def __init__(self, ttl: float = CLIENT_TTL, nstripes: int = NSTRIPES, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.stripes = [DupStripe() for _ in range(nstripes)]
+
+    def stripe(self, client_id: int) -> DupStripe:
+        return self.stripes[client_id % len(self.stripes)]
+
+    # Has (client_id, seq) already been executed? Returns (True, reply) for
+    # a duplicate, where reply is None if the client already acked it, and
+    # (False, None) for a new request.
+    def lookup(self, client_id: int, seq: int, ack: int = 0) -> Tuple[bool, Any]:
+        st = self.stripe(client_id)
+        with st.mu:
+            ent = st.entries.get(client_id)
+            if ent is None:
+                return False, None
+            ent.last_seen = self.clock()
+            if ent.reply is not None and ack >= ent.seq:
+                st.nbytes -= ent.size
+                ent.reply = None
+                ent.size = 0
+            if seq > ent.seq:
+                return False, None
+            return True, ent.reply if seq == ent.seq else None
+
+    # Remember the reply to (client_id, seq), replacing the client's older one.
+    def record(self, client_id: int, seq: int, reply: Any):
+        size = reply_size(reply)
+        now = self.clock()
+        st = self.stripe(client_id)
+        with st.mu:
+            ent = st.entries.get(client_id)
+            if ent is None:
+                st.entries[client_id] = DupEntry(seq, reply, size, now)
+            elif seq >= ent.seq:
+                st.nbytes -= ent.size
+                ent.seq = seq
+                ent.reply = reply
+                ent.size = size
+                ent.last_seen = now
+            else:
+                return
+            st.nbytes += size
+            st.nrecords += 1
+            if st.nrecords % SWEEP_INTERVAL == 0:
+                self.expire_locked(st, now)
+
+    # Forget clients idle for longer than ttl.
+    def expire(self):
+        now = self.clock()
+        for st in self.stripes:
+            with st.mu:
+                self.expire_locked(st, now)
+
+    def expire_locked(self, st: DupStripe, now: float):
+        idle = [cid for cid, ent in st.entries.items() if now - ent.last_seen > self.ttl]
+        for cid in idle:
+            st.nbytes -= st.entries.pop(cid).size
+
+    # (client id, seq) of every tracked client, for snapshots. Restoring
+    # them with record(client_id, seq, None) treats their replies as acked.
+    def seqs(self) -> List[Tuple[int, int]]:
+        out = []
+        for st in self.stripes:
+            with st.mu:
+                out += [(cid, ent.seq) for cid, ent in st.entries.items()]
+        return out
+
+    def __len__(self):
+        n = 0
+        for st in self.stripes:
+            with st.mu:
+                n += len(st.entries)
+        return n
+
+    # Memory accounting: number of clients tracked, how many still hold a
+    # cached reply, and an estimate of the bytes used by entries and replies.
+    def footprint(self) -> Dict[str, int]:
+        clients = 0
+        replies = 0
+        nbytes = 0
+        for st in self.stripes:
+            with st.mu:
+                clients += len(st.entries)
+                replies += sum(1 for ent in st.entries.values() if ent.reply is not None)
+                nbytes += st.nbytes
+        nbytes += clients * ENTRY_OVERHEAD
+        return {"clients": clients, "replies": replies, "bytes": nbytes}
+
+# Approximate bytes per tracked client besides its reply: the DupEntry, its
+# client id and its slot in the stripe's dict.
+ENTRY_OVERHEAD = sys.getsizeof(DupEntry(0, None, 0, 0.0)) + sys.getsizeof(1 << 62) + 64
+
+# Estimated bytes held by a reply object and its fields.
+def reply_size(reply: Any) -> int:
+    if reply is None:
+        return 0
+    n = sys.getsizeof(reply)
+    for v in getattr(reply, "__dict__", {}).values():
+        n += sys.getsizeof(v)
+    return n
@@ -0,0 +1,69 @@
+import unittest
+
+from dedup import *
+
+class Reply:
+    def __init__(self, value):
+        self.value = value
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestDuplicateTable(unittest.TestCase):
+    def test_duplicates(self):
+        dt = DuplicateTable()
+        self.assertEqual(dt.lookup(7, 1), (False, None))
+        r1 = Reply("a")
+        dt.record(7, 1, r1)
+        self.assertEqual(dt.lookup(7, 1), (True, r1))
+        self.assertEqual(dt.lookup(7, 2), (False, None))
+
+        # only the latest reply is kept
+        r2 = Reply("b")
+        dt.record(7, 2, r2)
+        self.assertEqual(dt.lookup(7, 2), (True, r2))
+        self.assertEqual(dt.lookup(7, 1), (True, None))
+
+    def test_ack_drops_reply(self):
+        dt = DuplicateTable()
+        dt.record(7, 1, Reply("x" * 10000))
+        fp = dt.footprint()
+        self.assertEqual(fp["replies"], 1)
+        self.assertGreater(fp["bytes"], 10000)
+
+        # the next request acks seq 1
+        self.assertEqual(dt.lookup(7, 2, ack=1), (False, None))
+        fp = dt.footprint()
+        self.assertEqual(fp["clients"], 1)
+        self.assertEqual(fp["replies"], 0)
+        self.assertLess(fp["bytes"], 1000)
+        # a late retry of seq 1 is still recognized
+        self.assertEqual(dt.lookup(7, 1, ack=1), (True, None))
+
+    def test_expire(self):
+        clock = FakeClock()
+        dt = DuplicateTable(ttl=10, clock=clock)
+        for cid in range(100):
+            dt.record(cid, 1, Reply("v"))
+        clock.now = 5
+        dt.lookup(3, 2)
+        clock.now = 12
+        dt.expire()
+        self.assertEqual(len(dt), 1)
+        self.assertEqual(dt.footprint()["clients"], 1)
+        self.assertTrue(dt.lookup(3, 1)[0])
+        self.assertEqual(dt.lookup(4, 1), (False, None))
+
+    def test_bounded(self):
+        dt = DuplicateTable()
+        for seq in range(1, 10000):
+            dt.lookup(1, seq, ack=seq - 1)
+            dt.record(1, seq, Reply("v" * 100))
+        fp = dt.footprint()
+        self.assertEqual(fp["clients"], 1)
+        self.assertEqual(fp["replies"], 1)
+        self.assertLess(fp["bytes"], 2000)
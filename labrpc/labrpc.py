@@ -3,7 +3,9 @@ import logging
 import random
 import time
 import io
+import math
 import queue
+import concurrent.futures
 from collections import defaultdict
 
 from labgob.labgob import LabEncoder, LabDecoder
@@ -11,18 +13,28 @@ from labgob.labgob import LabEncoder, LabDecoder
 logging.basicConfig(level=logging.FATAL)
 
 class ReqMsg:
-    def __init__(self, endname, svcMeth, argsType, args):
+    def __init__(self, endname, svcMeth, argsType, args, replyCh=None):
         self.endname = endname  # name of sending ClientEnd
         self.svcMeth = svcMeth  # e.g. "Raft.AppendEntries"
         self.argsType = argsType
         self.args = args
-        self.replyCh = queue.Queue()
+        self.replyCh = replyCh if replyCh is not None else queue.Queue()
 
 class ReplyMsg:
     def __init__(self, ok, reply):
         self.ok = ok
         self.reply = reply
 
+# Stands in for ReqMsg.replyCh in ClientEnd.call_async: the network's
+# put() of the ReplyMsg completes the future with the decoded reply, or
+# with TimeoutError if the RPC failed.
+class ReplyFuture(concurrent.futures.Future):
+    def put(self, rep, block=True, timeout=None):
+        if rep.ok:
+            self.set_result(LabDecoder(io.BytesIO(rep.reply)).decode())
+        else:
+            self.set_exception(TimeoutError())
+
 class ClientEnd:
     def __init__(self, endname, network):
         self.endname = endname  # this end-point's name
@@ -47,8 +59,250 @@ class ClientEnd:
         else:
             raise TimeoutError()
 
+    # Like call, but return at once with a concurrent.futures.Future for
+    # the reply, so one thread can have many RPCs outstanding.
+    def call_async(self, svcMeth, args) -> concurrent.futures.Future:
+        qb = io.BytesIO()
+        LabEncoder(qb).encode(args)
+        fut = ReplyFuture()
+        req = ReqMsg(self.endname, svcMeth, type(args), qb.getvalue(), fut)
+
+        try:
+            self.ch.put(req, block=False)
+        except queue.Full:
+            fut.set_exception(TimeoutError())
+        return fut
+
+# Most threads running server handlers at once. Requests beyond that wait
+# for a free worker, so a handler that blocks until some later RPC has been
+# handled can deadlock a network that is this busy.
+DISPATCH_WORKERS = 256
+
+# Threads delivering replies and checking on requests in progress. These
+# tasks never block.
+DELIVERY_WORKERS = 8
+
+# A worker with nothing to do for this many seconds exits.
+WORKER_IDLE = 1.0
+
+# How often a request waiting for its handler checks whether the server
+# has died or been disconnected.
+SERVER_CHECK_INTERVAL = 0.1
+
+# Runs tasks on at most max_workers threads. Threads are started only when
+# every existing one is busy, are reused for later tasks, and exit after
+# WORKER_IDLE seconds without work. Tasks beyond max_workers wait in FIFO
+# order.
+class WorkerPool:
+    def __init__(self, max_workers):
+        self.mu = threading.Lock()
+        self.max_workers = max_workers
+        self.tasks = queue.SimpleQueue()
+        self.nthreads = 0
+        self.nidle = 0  # workers waiting for a task
+        self.nqueued = 0  # tasks no worker has taken yet
+
+    def submit(self, fn, *args):
+        self.tasks.put((fn, args))
+        with self.mu:
+            self.nqueued += 1
+            if self.nqueued <= self.nidle or self.nthreads >= self.max_workers:
+                return
+            self.nthreads += 1
+        threading.Thread(target=self.worker, daemon=True).start()
+
+    def worker(self):
+        while True:
+            with self.mu:
+                self.nidle += 1
+            try:
+                fn, args = self.tasks.get(timeout=WORKER_IDLE)
+            except queue.Empty:
+                with self.mu:
+                    self.nidle -= 1
+                    # a task may have been queued for this worker as it timed out
+                    if self.nqueued <= self.nidle:
+                        self.nthreads -= 1
+                        return
+                continue
+            with self.mu:
+                self.nidle -= 1
+                self.nqueued -= 1
+            try:
+                fn(*args)
+            except Exception:
+                logging.exception("labrpc: task failed")
+
+# Resolution of TimerWheel, in seconds.
+TIMER_TICK = 0.001
+
+# Slots per TimerWheel level, as powers of two. Level 0 covers 256 ticks,
+# each level above 64 times the one below, about 18 hours in all; longer
+# delays are cut to that.
+TIMER_LEVEL_BITS = (8, 6, 6, 6)
+
+class TimerHandle:
+    __slots__ = ("tick", "fn", "args", "on_cancel", "slot")
+
+    def __init__(self, tick, fn, args, on_cancel):
+        self.tick = tick  # the wheel tick at which it fires
+        self.fn = fn
+        self.args = args
+        self.on_cancel = on_cancel
+        self.slot = None  # set holding it, or None once fired or cancelled
+
+# Runs tasks on pool after a delay. Timers sit in a hierarchical hashed
+# wheel: level 0 has a slot per tick, and each higher level has a slot per
+# full turn of the level below, whose timers are moved down when that
+# level comes round to them. Adding and cancelling a timer are O(1).
+#
+# A single thread advances the wheel, sleeping until the next occupied
+# level-0 slot; it exits while no timers are pending. stop() cancels
+# everything pending and every timer added after it, calling on_cancel
+# with the timer's args if one was given.
+class TimerWheel:
+    def __init__(self, pool, tick=TIMER_TICK, level_bits=TIMER_LEVEL_BITS):
+        self.pool = pool
+        self.tick_len = tick
+        self.level_bits = level_bits
+        self.max_delay = (1 << sum(level_bits)) - 1  # in ticks
+        self.levels = [[set() for _ in range(1 << bits)] for bits in level_bits]
+        self.mu = threading.Lock()
+        self.cond = threading.Condition(self.mu)
+        self.start = time.monotonic()
+        self.tick = 0  # last tick processed
+        self.count = 0  # timers pending
+        self.running = False
+        self.stopped = False
+
+    def now_tick(self):
+        return int((time.monotonic() - self.start) / self.tick_len)
+
+    def call_later(self, delay, fn, *args, on_cancel=None):
+        with self.mu:
+            stopped = self.stopped
+            if stopped:
+                h = TimerHandle(0, fn, args, on_cancel)
+            else:
+                if not self.running:
+                    self.tick = self.now_tick()  # nothing pending, so nothing to run on the way
+                ticks = max(1, math.ceil(delay / self.tick_len))
+                h = TimerHandle(min(self.now_tick() + ticks, self.tick + self.max_delay), fn, args, on_cancel)
+                self.place(h)
+                self.count += 1
+                self.cond.notify()
+                if self.running:
+                    return h
+                self.running = True
+        if stopped:
+            if on_cancel is not None:
+                on_cancel(*args)
+            return h
+        threading.Thread(target=self.run, daemon=True).start()
+        return h
+
+    # Cancel h if it has not fired yet; returns whether it was pending.
+    # on_cancel is not called.
+    def cancel(self, h) -> bool:
+        with self.mu:
+            if h.slot is None:
+                return False
+            h.slot.discard(h)
+            h.slot = None
+            self.count -= 1
+            return True
+
+    def stop(self):
+        with self.mu:
+            self.stopped = True
+            pending = []
+            for level in self.levels:
+                for slot in level:
+                    pending += slot
+                    slot.clear()
+            self.count = 0
+            self.cond.notify()
+        for h in pending:
+            h.slot = None
+            if h.on_cancel is not None:
+                h.on_cancel(*h.args)
+
+    # The caller holds mu.
+    def place(self, h):
+        diff = h.tick - self.tick
+        shift = 0
+        for i, bits in enumerate(self.level_bits):
+            if diff < (1 << (shift + bits)) or i == len(self.level_bits) - 1:
+                h.slot = self.levels[i][(h.tick >> shift) & ((1 << bits) - 1)]
+                h.slot.add(h)
+                return
+            shift += bits
+
+    # Move to the next tick and hand its timers to the pool. The caller
+    # holds mu.
+    def advance(self):
+        self.tick += 1
+        shift = self.level_bits[0]
+        for i in range(1, len(self.level_bits)):
+            if self.tick & ((1 << shift) - 1):
+                break
+            slot = self.levels[i][(self.tick >> shift) & ((1 << self.level_bits[i]) - 1)]
+            moved = list(slot)
+            slot.clear()
+            for h in moved:
+                self.place(h)
+            shift += self.level_bits[i]
+
+        slot = self.levels[0][self.tick & ((1 << self.level_bits[0]) - 1)]
+        for h in slot:
+            h.slot = None
+            self.pool.submit(h.fn, *h.args)
+        self.count -= len(slot)
+        slot.clear()
+
+    # Ticks until the next occupied level-0 slot, or until level 0 wraps
+    # and the levels above need looking at.
+    def next_wait(self):
+        size = 1 << self.level_bits[0]
+        idx = self.tick & (size - 1)
+        for d in range(1, size - idx + 1):
+            if d == size - idx or self.levels[0][idx + d]:
+                return d
+
+    def run(self):
+        with self.mu:
+            while self.count > 0:
+                now = self.now_tick()
+                while self.tick < now and self.count > 0:
+                    self.advance()
+                if self.count == 0:
+                    break
+                wait = self.start + (self.tick + self.next_wait()) * self.tick_len - time.monotonic()
+                if wait > 0:
+                    self.cond.wait(wait)
+            self.running = False
+
+# A request that has been handed to its server's handler. Exactly one of
+# the handler's completion and the server check produces the reply.
+class PendingCall:
+    def __init__(self, req, servername, server, isreliable, long_reordering):
+        self.req = req
+        self.servername = servername
+        self.server = server
+        self.isreliable = isreliable
+        self.long_reordering = long_reordering
+        self.mu = threading.Lock()
+        self.done = False
+
+    def finish(self) -> bool:
+        with self.mu:
+            if self.done:
+                return False
+            self.done = True
+            return True
+
 class Network:
-    def __init__(self):
+    def __init__(self, dispatch_workers=DISPATCH_WORKERS, delivery_workers=DELIVERY_WORKERS):
         self.mu = threading.Lock()
         self.isreliable = True
         self.longDelays = False
@@ -62,11 +316,19 @@ class Network:
         self.count = 0
         self.bytes = 0
 
+        # server handlers run on dispatchers; replies, including delayed
+        # ones, are sent from deliverers
+        self.dispatchers = WorkerPool(dispatch_workers)
+        self.deliverers = WorkerPool(delivery_workers)
+        self.timers = TimerWheel(self.deliverers)
+
         # single thread to handle all ClientEnd.call()s
         threading.Thread(target=self._process_requests, daemon=True).start()
 
+    # Stop the network. Requests still waiting on a timer fail at once.
     def cleanup(self):
         self.done.set()
+        self.timers.stop()
 
     def reliable(self, yes):
         with self.mu:
@@ -91,7 +353,7 @@ class Network:
                 self.count += 1
                 self.bytes += len(xreq.args)
 
-            threading.Thread(target=self.process_req, args=(xreq,), daemon=True).start()
+            self.process_req(xreq)
 
     def read_endname_info(self, endname):
         with self.mu:
@@ -107,47 +369,49 @@ class Network:
         with self.mu:
             return not self.enabled[endname] or self.servers[servername] != server
 
+    # Called from the _process_requests thread, so everything that can take
+    # time happens later on a pool.
     def process_req(self, req):
         enabled, servername, server, isreliable, long_reordering = self.read_endname_info(req.endname)
         if enabled and (servername is not None) and (server is not None):
+            call = PendingCall(req, servername, server, isreliable, long_reordering)
             if not isreliable:
-                time.sleep(random.randint(0, 27) / 1000)
-
-            if not isreliable and random.randint(0, 999) < 100:
-                req.replyCh.put(ReplyMsg(False, None))
-                return
-
-            ech = queue.Queue()
-
-            def dispatch():
-                r = server.dispatch(req)
-                ech.put(r)
-
-            threading.Thread(target=dispatch, daemon=True).start()
-
-            reply = None
-            reply_ok = False
-            server_dead = False
-
-            while not reply_ok and not server_dead:
-                try:
-                    reply = ech.get(timeout=0.1)
-                    reply_ok = True
-                except queue.Empty:
-                    server_dead = self.is_server_dead(req.endname, servername, server)
-
-            if not reply_ok or server_dead:
-                req.replyCh.put(ReplyMsg(False, None))
-            elif not isreliable and random.randint(0, 999) < 100:
-                req.replyCh.put(ReplyMsg(False, None))
-            elif long_reordering and random.randint(0, 899) < 600:
-                ms = 200 + random.randint(0, 2000)
-                threading.Timer(ms / 1000, lambda: req.replyCh.put(reply)).start()
+                self.timers.call_later(random.randint(0, 27) / 1000, self.start_call, call, on_cancel=self.cancel_call)
             else:
-                req.replyCh.put(reply)
+                self.start_call(call)
         else:
             ms = random.randint(0, 7000) if self.longDelays else random.randint(0, 100)
-            threading.Timer(ms / 1000, lambda: req.replyCh.put(ReplyMsg(False, None))).start()
+            self.timers.call_later(ms / 1000, self.send_reply, req, ReplyMsg(False, None), on_cancel=self.cancel_reply)
+
+    def start_call(self, call):
+        if not call.isreliable and random.randint(0, 999) < 100:
+            call.req.replyCh.put(ReplyMsg(False, None))
+            return
+        self.dispatchers.submit(self.run_call, call)
+        self.timers.call_later(SERVER_CHECK_INTERVAL, self.check_call, call, on_cancel=self.cancel_call)
+
+    def run_call(self, call):
+        reply = call.server.dispatch(call.req)
+        if not call.finish():
+            return
+        if not call.isreliable and random.randint(0, 999) < 100:
+            call.req.replyCh.put(ReplyMsg(False, None))
+        elif call.long_reordering and random.randint(0, 899) < 600:
+            ms = 200 + random.randint(0, 2000)
+            self.timers.call_later(ms / 1000, self.send_reply, call.req, reply, on_cancel=self.cancel_reply)
+        else:
+            call.req.replyCh.put(reply)
+
+    # Fail a call whose server died or was disconnected while its handler
+    # was running; otherwise look again later.
+    def check_call(self, call):
+        if call.done:
+            return
+        if self.is_server_dead(call.req.endname, call.servername, call.server):
+            if call.finish():
+                call.req.replyCh.put(ReplyMsg(False, None))
+        else:
+            self.timers.call_later(SERVER_CHECK_INTERVAL, self.check_call, call, on_cancel=self.cancel_call)
 
     def make_end(self, endname):
         with self.mu:
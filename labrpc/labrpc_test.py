@@ -285,3 +285,82 @@ class TestUnreliable(unittest.TestCase):
         n = rn.get_count(1000)
         self.assertEqual(n, total, f"wrong get_count() {n}, expected {total}")
 
+
+class TestCallAsync(unittest.TestCase):
+    def test_call_async(self):
+        rn = Network()
+        self.addCleanup(rn.cleanup)
+
+        e = rn.make_end("end1-99")
+
+        js = JunkServer()
+        svc = Service(js)
+
+        rs = Server()
+        rs.add_service(svc)
+        rn.add_server("server99", rs)
+
+        rn.connect("end1-99", "server99")
+        rn.enable("end1-99", True)
+
+        futs = [e.call_async("JunkServer.handler2", i) for i in range(50)]
+        for i, fut in enumerate(futs):
+            self.assertEqual(fut.result(timeout=5)[0], f"handler2-{i}")
+
+        rn.enable("end1-99", False)
+        fut = e.call_async("JunkServer.handler2", 111)
+        self.assertRaises(TimeoutError, fut.result, 5)
+
+class TestWorkerPool(unittest.TestCase):
+    def test_worker_pool(self):
+        pool = WorkerPool(4)
+        mu = threading.Lock()
+        running = [0, 0]  # now, most at once
+        done = threading.Semaphore(0)
+
+        def task():
+            with mu:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            time.sleep(0.01)
+            with mu:
+                running[0] -= 1
+            done.release()
+
+        for _ in range(40):
+            pool.submit(task)
+        for _ in range(40):
+            self.assertTrue(done.acquire(timeout=5))
+        self.assertEqual(running[1], 4)
+        self.assertLessEqual(pool.nthreads, 4)
+
+class TestTimerWheel(unittest.TestCase):
+    def test_timer_wheel(self):
+        wheel = TimerWheel(WorkerPool(2))
+        mu = threading.Lock()
+        fired = []
+        cancelled = []
+
+        def fire(i):
+            with mu:
+                fired.append(i)
+
+        # delays spanning the first two levels, added out of order
+        delays = [0.3, 0.005, 0.05, 0.001, 0.2, 0.02]
+        t0 = time.monotonic()
+        for i, d in enumerate(delays):
+            wheel.call_later(d, fire, i)
+        h = wheel.call_later(0.1, fire, 99)
+        self.assertTrue(wheel.cancel(h))
+        self.assertFalse(wheel.cancel(h))
+        wheel.call_later(60, fire, 100, on_cancel=cancelled.append)
+
+        while len(fired) < len(delays) and time.monotonic() - t0 < 5:
+            time.sleep(0.01)
+        self.assertGreaterEqual(time.monotonic() - t0, 0.3)
+        self.assertEqual(fired, sorted(range(len(delays)), key=lambda i: delays[i]))
+
+        wheel.stop()
+        self.assertEqual(cancelled, [100])
+        wheel.call_later(0.01, fire, 101, on_cancel=cancelled.append)
+        self.assertEqual(cancelled, [100, 101])
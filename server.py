@@ -1,6 +1,15 @@
+import contextlib
 import logging
+import os
 import threading
-from typing import Tuple, Any
+from typing import Tuple, Any, List
+
+from dedup import DuplicateTable
+from shardmap import get_shardmap
+from snapshot import load_snapshot, write_snapshot
+from storage import ShardedStore
+from wal import WriteAheadLog, Record, read_records
+import wal
 
 debugging = False
 
@@ -9,17 +18,31 @@ def debug(format, *args):
     if debugging:
         logging.info(format % args)
 
+OK = "OK"
+ErrWrongGroup = "ErrWrongGroup"
+
 # Put or Append
 class PutAppendArgs:
     # Add definitions here if needed
-    def __init__(self, key, value):
+    def __init__(self, key, value, client_id=0, seq=0, ack=0, compact=False, tail=0, crc=False):
         self.key = key
         self.value = value
+        self.client_id = client_id  # identifies the Clerk, for duplicate detection
+        self.seq = seq  # per-Clerk sequence number of this request
+        self.ack = ack  # the Clerk has received the replies to all requests <= ack
+        # Append only: reply with the old value's length instead of the old
+        # value, plus its last tail characters and, if crc, its CRC-32.
+        self.compact = compact
+        self.tail = tail
+        self.crc = crc
 
 class PutAppendReply:
     # Add definitions here if needed
-    def __init__(self, value):
-        self.value = value
+    def __init__(self, value, err=OK, prev_len=0, prev_crc=0):
+        self.value = value  # old value, or with compact its requested tail
+        self.err = err
+        self.prev_len = prev_len  # compact Append only
+        self.prev_crc = prev_crc  # compact Append with crc only
 
 class GetArgs:
     # Add definitions here if needed
@@ -28,33 +51,267 @@ class GetArgs:
 
 class GetReply:
     # Add definitions here if needed
-    def __init__(self, value):
+    def __init__(self, value, err=OK):
         self.value = value
+        self.err = err
+
+# Batched requests: all keys must belong to one shard. Writes are applied
+# in list order, so a key may appear more than once.
+class MultiGetArgs:
+    def __init__(self, keys):
+        self.keys = keys
+
+class MultiGetReply:
+    def __init__(self, values, err=OK):
+        self.values = values
+        self.err = err
+
+class MultiPutAppendArgs:
+    def __init__(self, keys, values, client_id=0, seq=0, ack=0):
+        self.keys = keys
+        self.values = values
+        self.client_id = client_id
+        self.seq = seq
+        self.ack = ack
+
+class MultiPutAppendReply:
+    def __init__(self, values, err=OK):
+        self.values = values  # MultiAppend: the old value of each key
+        self.err = err
 
 class KVServer:
-    def __init__(self, cfg):
+    def __init__(self, cfg, me=0):
         self.mu = threading.Lock()
         self.cfg = cfg
+        self.me = me
 
         # Your definitions here.
+        self.store = ShardedStore(cfg.npartitions)
+        self.dups = DuplicateTable()
+        self.wal = None
+        self.wal_gen = 0  # generation of the log file being written
+        self.snapshotting = False  # guarded by mu
+        if cfg.persist_dir is not None:
+            self._recover()
+
+    # Stop the server, as if it crashed; logged writes survive.
+    def kill(self):
+        if self.wal is not None:
+            self.wal.close()
+
+    # Persistent state lives in persist_dir: a snapshot plus the log files
+    # written since it was taken, one file per generation.
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.cfg.persist_dir, f"kvserver-{self.me}.snap")
+
+    def _wal_path(self, gen: int) -> str:
+        return os.path.join(self.cfg.persist_dir, f"kvserver-{self.me}-{gen}.wal")
+
+    def _wal_gens(self) -> List[int]:
+        prefix = f"kvserver-{self.me}-"
+        gens = []
+        for name in os.listdir(self.cfg.persist_dir):
+            if name.startswith(prefix) and name.endswith(".wal"):
+                gens.append(int(name[len(prefix):-len(".wal")]))
+        return sorted(gens)
+
+    # Map the snapshot, whose values are decoded only when first used, then
+    # replay the logs written after it.
+    def _recover(self):
+        snap = load_snapshot(self._snapshot_path())
+        if snap is not None:
+            self.wal_gen = snap.gen
+            for key, value in snap.values:
+                self.store.load(key, value)
+            for client_id, seq in snap.clients:
+                self.dups.record(client_id, seq, None)
+        for gen in self._wal_gens():
+            if gen < self.wal_gen:
+                os.remove(self._wal_path(gen))
+                continue
+            for rec, _ in read_records(self._wal_path(gen)):
+                args, op = record_args(rec)
+                self._apply_locked(args, op)
+            self.wal_gen = gen
+        self.wal = WriteAheadLog(self._wal_path(self.wal_gen), self.cfg.group_commit)
+
+    # Write a snapshot of the store and start a new log generation. The
+    # store is captured with every partition locked, which also holds off
+    # writes to the log, so the snapshot covers exactly the log files
+    # before the new generation. Files are written after the locks are
+    # released.
+    def snapshot(self):
+        with contextlib.ExitStack() as stack:
+            for p in self.store.partitions:
+                stack.enter_context(p.mu)
+            values = [(key, v.frozen()) for p in self.store.partitions for key, v in p.data.items()]
+            clients = self.dups.seqs()
+            self.wal_gen += 1
+            gen = self.wal_gen
+            self.wal.rotate(self._wal_path(gen))
+        write_snapshot(self._snapshot_path(), gen, values, clients)
+        for old in self._wal_gens():
+            if old < gen:
+                os.remove(self._wal_path(old))
+
+    # Snapshot in the background once the current log file passes
+    # cfg.snapshot_bytes.
+    def _maybe_snapshot(self):
+        limit = self.cfg.snapshot_bytes
+        if limit is None or self.wal is None or self.wal.size < limit:
+            return
+        with self.mu:
+            if self.snapshotting:
+                return
+            self.snapshotting = True
+
+        def run():
+            try:
+                self.snapshot()
+            finally:
+                with self.mu:
+                    self.snapshotting = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    # The servers holding key, primary first, as the clerks see it.
+    def _group(self, key: str) -> Tuple[int, ...]:
+        return get_shardmap(self.cfg.nservers, self.cfg.nreplicas).group(key)
+
+    def _owns(self, key: str) -> bool:
+        return self.me in self._group(key)
+
+    # Every KVServer holding a replica of key, in server-id order.
+    def _replicas(self, key: str) -> List["KVServer"]:
+        return [self.cfg.kvservers[i] for i in sorted(self._group(key))]
+
+    # Hold the partition locks for keys in every replica of their shard.
+    # Locks are taken in (server id, partition index) order, so concurrent
+    # writes through different replicas cannot deadlock and are applied in
+    # the same order everywhere.
+    @contextlib.contextmanager
+    def _lock_keys(self, keys: List[str]):
+        with contextlib.ExitStack() as stack:
+            for kv in self._replicas(keys[0]):
+                for i in sorted({kv.store.index(key) for key in keys}):
+                    stack.enter_context(kv.store.partitions[i].mu)
+            yield
 
     def Get(self, args: GetArgs):
         reply = GetReply(None)
 
-        # Your code here.
+        if not self._owns(args.key):
+            reply.err = ErrWrongGroup
+            return reply
+        reply.value = self.store.get(args.key)
 
         return reply
 
     def Put(self, args: PutAppendArgs):
         reply = PutAppendReply(None)
+        return self._write(args, [args.key], reply, "Put")
+
+    def Append(self, args: PutAppendArgs):
+        reply = PutAppendReply(None)
+        return self._write(args, [args.key], reply, "Append")
 
-        # Your code here.
+    # Each key is read on its own; the batch is not a snapshot.
+    def MultiGet(self, args: MultiGetArgs):
+        reply = MultiGetReply(None)
+
+        if not all(self._owns(key) for key in args.keys):
+            reply.err = ErrWrongGroup
+            return reply
+        reply.values = [self.store.get(key) for key in args.keys]
 
         return reply
 
-    def Append(self, args: PutAppendArgs):
-        reply = PutAppendReply(None)
+    def MultiPut(self, args: MultiPutAppendArgs):
+        reply = MultiPutAppendReply(None)
+        return self._write(args, args.keys, reply, "MultiPut")
+
+    def MultiAppend(self, args: MultiPutAppendArgs):
+        reply = MultiPutAppendReply(None)
+        return self._write(args, args.keys, reply, "MultiAppend")
 
-        # Your code here.
+    # Execute a write on keys at most once. It is applied to every replica
+    # while all of the keys' partitions are locked, and logged there in the
+    # same order. The reply waits for the logs afterwards, outside the
+    # locks, so concurrent writers can share one fsync.
+    def _write(self, args, keys: List[str], reply, op: str):
+        if not keys:
+            return reply
+        if not all(self._owns(key) for key in keys):
+            reply.err = ErrWrongGroup
+            return reply
+
+        logged = []
+        with self._lock_keys(keys):
+            dup, cached = self.dups.lookup(args.client_id, args.seq, args.ack)
+            if dup:
+                # a reply the client has acked will not be read
+                return cached if cached is not None else reply
+            rec = None
+            for kv in self._replicas(keys[0]):
+                reply = kv._apply_locked(args, op)
+                if kv.wal is not None:
+                    rec = rec or log_record(args, op)
+                    logged.append((kv.wal, kv.wal.append(rec)))
+        for log, lsn in logged:
+            log.wait(lsn)
+        for kv in self._replicas(keys[0]):
+            kv._maybe_snapshot()
 
         return reply
+
+    # Execute a write on this replica and remember its reply. The caller
+    # holds the partition locks for the keys.
+    def _apply_locked(self, args, op: str):
+        if op.startswith("Multi"):
+            return self._apply_many_locked(args, op[len("Multi"):])
+        reply = PutAppendReply(None)
+        p = self.store.partition(args.key)
+        if op == "Put":
+            p.put_locked(args.key, args.value)
+        elif args.compact:
+            reply.prev_len, crc, reply.value = p.append_summary_locked(args.key, args.value, args.tail)
+            if args.crc:
+                reply.prev_crc = crc
+        else:
+            reply.value = p.append_locked(args.key, args.value)
+        self.dups.record(args.client_id, args.seq, reply)
+        return reply
+
+    # The batched form of _apply_locked.
+    def _apply_many_locked(self, args: MultiPutAppendArgs, op: str):
+        reply = MultiPutAppendReply(None)
+        if op == "Append":
+            reply.values = []
+        for key, value in zip(args.keys, args.values):
+            p = self.store.partition(key)
+            if op == "Put":
+                p.put_locked(key, value)
+            else:
+                reply.values.append(p.append_locked(key, value))
+        self.dups.record(args.client_id, args.seq, reply)
+        return reply
+
+OpCodes = {"Put": wal.OpPut, "Append": wal.OpAppend, "MultiPut": wal.OpMultiPut, "MultiAppend": wal.OpMultiAppend}
+OpNames = {code: op for op, code in OpCodes.items()}
+
+# The log record for a write, and back.
+def log_record(args, op: str) -> Record:
+    if op.startswith("Multi"):
+        return Record(OpCodes[op], args.client_id, args.seq, list(zip(args.keys, args.values)))
+    flags = (wal.FlagCompact if args.compact else 0) | (wal.FlagCrc if args.crc else 0)
+    return Record(OpCodes[op], args.client_id, args.seq, [(args.key, args.value)], flags, args.tail)
+
+def record_args(rec: Record):
+    op = OpNames[rec.op]
+    if op.startswith("Multi"):
+        args = MultiPutAppendArgs([k for k, _ in rec.pairs], [v for _, v in rec.pairs], rec.client_id, rec.seq)
+    else:
+        key, value = rec.pairs[0]
+        args = PutAppendArgs(key, value, rec.client_id, rec.seq, compact=bool(rec.flags & wal.FlagCompact),
+                             tail=rec.tail, crc=bool(rec.flags & wal.FlagCrc))
+    return args, op
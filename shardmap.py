@@ -0,0 +1,66 @@
+import bisect
+import functools
+import hashlib
+from typing import List, Tuple
+
+# Points each server gets on the hash ring. More points even out the share
+# of keys each server owns.
+VNODES = 128
+
+def ring_hash(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "big")
+
+# Consistent hashing of keys onto servers 0..nservers-1. Each server is
+# placed at VNODES points on a ring of 64-bit hashes; a key belongs to the
+# first point at or after its own hash, and its replica group is that point's
+# server followed by the next distinct servers clockwise, nreplicas in all.
+# Adding or removing a server only moves the keys next to its points, about
+# 1/nservers of them.
+#
+# The group for every ring point is computed up front, so a lookup is one
+# binary search. Shards are numbered by distinct replica group: two keys are
+# in the same shard exactly when they have the same group.
+class ShardMap:
+    def __init__(self, nservers: int, nreplicas: int = 1, vnodes: int = VNODES):
+        if nservers < 1:
+            raise ValueError(f"ShardMap: need at least one server, got {nservers}")
+        self.nservers = nservers
+        self.nreplicas = min(max(nreplicas, 1), nservers)
+
+        points = sorted((ring_hash(f"server-{srv}-{v}"), srv) for srv in range(nservers) for v in range(vnodes))
+        self.hashes = [h for h, _ in points]
+        owners = [srv for _, srv in points]
+
+        self.groups: List[Tuple[int, ...]] = []  # shard -> replica group, primary first
+        shard_of_group = {}
+        self.point_shard = []  # ring point -> shard
+        for i in range(len(points)):
+            group = []
+            j = i
+            while len(group) < self.nreplicas:
+                if owners[j] not in group:
+                    group.append(owners[j])
+                j = (j + 1) % len(points)
+            group = tuple(group)
+            if group not in shard_of_group:
+                shard_of_group[group] = len(self.groups)
+                self.groups.append(group)
+            self.point_shard.append(shard_of_group[group])
+
+    def shard(self, key: str) -> int:
+        i = bisect.bisect_left(self.hashes, ring_hash(key))
+        if i == len(self.hashes):
+            i = 0
+        return self.point_shard[i]
+
+    # The servers holding key, primary first.
+    def group(self, key: str) -> Tuple[int, ...]:
+        return self.groups[self.shard(key)]
+
+    def owns(self, srv: int, key: str) -> bool:
+        return srv in self.group(key)
+
+# Clerks and servers of one configuration share the same precomputed map.
+@functools.lru_cache(maxsize=64)
+def get_shardmap(nservers: int, nreplicas: int) -> ShardMap:
+    return ShardMap(nservers, nreplicas)
@@ -0,0 +1,44 @@
+import unittest
+
+from shardmap import *
+
+class TestShardMap(unittest.TestCase):
+    def test_groups(self):
+        sm = ShardMap(5, 3)
+        for i in range(1000):
+            key = str(i)
+            group = sm.group(key)
+            self.assertEqual(len(group), 3)
+            self.assertEqual(len(set(group)), 3)
+            self.assertTrue(all(0 <= srv < 5 for srv in group))
+            self.assertEqual(sm.groups[sm.shard(key)], group)
+            self.assertTrue(sm.owns(group[0], key))
+
+        # more replicas than servers
+        self.assertEqual(sorted(ShardMap(2, 3).group("k")), [0, 1])
+
+    def test_balance(self):
+        sm = ShardMap(5, 1)
+        counts = [0] * 5
+        for i in range(10000):
+            counts[sm.group(str(i))[0]] += 1
+        for c in counts:
+            self.assertTrue(1400 <= c <= 2600, f"unbalanced shard map {counts}")
+
+    def test_minimal_movement(self):
+        n = 10000
+        for nservers in (3, 5, 8):
+            before = ShardMap(nservers, 1)
+            after = ShardMap(nservers + 1, 1)
+            moved = 0
+            for i in range(n):
+                p0 = before.group(str(i))[0]
+                p1 = after.group(str(i))[0]
+                if p0 != p1:
+                    # keys only move to the new server
+                    self.assertEqual(p1, nservers)
+                    moved += 1
+            self.assertLess(moved / n, 2.0 / (nservers + 1), f"{moved} of {n} keys moved")
+
+    def test_shared(self):
+        self.assertIs(get_shardmap(3, 2), get_shardmap(3, 2))
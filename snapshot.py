@@ -0,0 +1,101 @@
+import mmap
+import os
+import struct
+from typing import Iterable, List, Optional, Tuple
+
+from storage import ChunkedValue
+
+# Snapshot layout, little-endian:
+#
+#   header:     8-byte MAGIC, u64 log generation, u64 directory offset,
+#               u32 key count, u32 client count
+#   values:     every value's UTF-8 bytes, back to back
+#   directory:  per key: u32 key length, key, u64 value offset,
+#               u64 value bytes, u64 value characters, u32 value CRC-32
+#   clients:    per client: u64 client id, u64 seq
+#
+# The directory lets a server map the file and find every value without
+# reading it, so loading costs O(keys) and a value is decoded only when it
+# is first used. The log generation is the first log file not covered by
+# the snapshot.
+MAGIC = b"KVSNAP01"
+HEADER = struct.Struct("<8sQQII")
+DIRENT = struct.Struct("<QQQI")
+KLEN = struct.Struct("<I")
+CLIENT = struct.Struct("<QQ")
+
+class Snapshot:
+    def __init__(self, gen: int, values: List[Tuple[str, ChunkedValue]], clients: List[Tuple[int, int]]):
+        self.gen = gen
+        self.values = values  # values refer to the file's mapping until read
+        self.clients = clients  # (client id, seq) of the latest write seen from each client
+
+# Write a snapshot to path, atomically replacing any older one. values are
+# (key, ChunkedValue.frozen()) pairs.
+def write_snapshot(path: str, gen: int, values: Iterable[Tuple[str, Tuple]], clients: List[Tuple[int, int]]):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 0, 0, 0, 0))
+        off = HEADER.size
+        dirents = []
+        for key, (base, segments, nchars, crc) in values:
+            start = off
+            if base is not None:
+                f.write(base)
+                off += len(base)
+            for seg in segments:
+                b = seg.encode("utf-8", "surrogatepass")
+                f.write(b)
+                off += len(b)
+            dirents.append((key, start, off - start, nchars, crc))
+
+        dir_off = off
+        parts = []
+        for key, voff, nbytes, nchars, crc in dirents:
+            kb = key.encode("utf-8", "surrogatepass")
+            parts += [KLEN.pack(len(kb)), kb, DIRENT.pack(voff, nbytes, nchars, crc)]
+        for client_id, seq in clients:
+            parts.append(CLIENT.pack(client_id, seq))
+        f.write(b"".join(parts))
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, gen, dir_off, len(dirents), len(clients)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    sync_dir(os.path.dirname(path) or ".")
+
+# Map the snapshot at path, or return None if there is none. Values stay
+# in the mapping until they are read.
+def load_snapshot(path: str) -> Optional[Snapshot]:
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    buf = memoryview(mm)
+    magic, gen, off, nkeys, nclients = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError(f"load_snapshot: {path} is not a snapshot")
+
+    values = []
+    for _ in range(nkeys):
+        (n,) = KLEN.unpack_from(buf, off)
+        key = str(buf[off + KLEN.size:off + KLEN.size + n], "utf-8", "surrogatepass")
+        off += KLEN.size + n
+        voff, nbytes, nchars, crc = DIRENT.unpack_from(buf, off)
+        off += DIRENT.size
+        values.append((key, ChunkedValue.mapped(buf[voff:voff + nbytes], nchars, crc)))
+    clients = []
+    for _ in range(nclients):
+        clients.append(CLIENT.unpack_from(buf, off))
+        off += CLIENT.size
+    return Snapshot(gen, values, clients)
+
+def sync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
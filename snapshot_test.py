@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+
+from snapshot import *
+from storage import ChunkedValue, crc32
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "test.snap")
+
+    def test_roundtrip(self):
+        a = ChunkedValue("hello")
+        a.append(" wörld")
+        b = ChunkedValue()
+        self.assertIsNone(load_snapshot(self.path))
+        write_snapshot(self.path, 3, [("a", a.frozen()), ("b", b.frozen())], [(7, 2), (1 << 63, 9)])
+
+        snap = load_snapshot(self.path)
+        self.assertEqual(snap.gen, 3)
+        self.assertEqual(snap.clients, [(7, 2), (1 << 63, 9)])
+        values = dict(snap.values)
+        self.assertEqual(sorted(values), ["a", "b"])
+        self.assertEqual(len(values["a"]), len("hello wörld"))
+        self.assertEqual(values["a"].value(), "hello wörld")
+        self.assertEqual(values["b"].value(), "")
+
+    def test_lazy(self):
+        write_snapshot(self.path, 1, [("k", ChunkedValue("abcdé").frozen())], [])
+        v = dict(load_snapshot(self.path).values)["k"]
+        self.assertFalse(v.loaded())
+        self.assertEqual(v.crc, crc32("abcdé"))
+
+        # appends and short suffixes don't decode the mapped prefix
+        v.append("xyz")
+        self.assertEqual(v.suffix(2), "yz")
+        self.assertFalse(v.loaded())
+        self.assertEqual(v.crc, crc32("abcdéxyz"))
+
+        # a snapshot of a value that was never decoded copies its bytes
+        path2 = os.path.join(self.dir.name, "test2.snap")
+        write_snapshot(path2, 2, [("k", v.frozen())], [])
+        self.assertEqual(dict(load_snapshot(path2).values)["k"].value(), "abcdéxyz")
+
+        self.assertEqual(v.suffix(5), "déxyz")
+        self.assertTrue(v.loaded())
+        self.assertEqual(v.value(), "abcdéxyz")
+
+if __name__ == "__main__":
+    unittest.main()
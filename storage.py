@@ -0,0 +1,194 @@
+import threading
+import zlib
+from typing import Dict, Tuple
+
+# Default number of lock stripes in a ShardedStore. A key always hashes to
+# the same partition, so operations on one key are serialized by that
+# partition's lock while keys in other partitions proceed in parallel.
+NPARTITIONS = 16
+
+# A ChunkedValue's segments are merged until they reach CHUNK_SIZE
+# characters, and at most TAIL_SEGMENTS small appends are kept before being
+# joined, so the per-segment overhead stays a small fraction of the value.
+CHUNK_SIZE = 64 * 1024
+TAIL_SEGMENTS = 32
+
+# A string value built by appends. Appended segments are kept as a list and
+# only joined when the whole value is needed; the joined string is cached
+# until the next append. Appending is O(len(s)) amortized instead of a copy
+# of the entire value. The length and a CRC-32 of the value's UTF-8 encoding
+# are kept up to date so neither needs a join.
+#
+# A value loaded from a snapshot starts out as base, a view of its UTF-8
+# bytes in the mapped file, and is decoded the first time its contents are
+# needed. Appends before that do not decode it.
+class ChunkedValue:
+    __slots__ = ("base", "chunks", "tail", "length", "crc", "joined")
+
+    def __init__(self, s: str = ""):
+        self.base = None  # undecoded UTF-8 prefix of the value, if any
+        self.chunks = [s] if s else []  # all but the last are >= CHUNK_SIZE
+        self.tail = []  # recent small appends, not yet merged into chunks
+        self.length = len(s)
+        self.crc = crc32(s)
+        self.joined = s  # the full value, or None if appends happened since
+
+    # A value of nchars characters whose UTF-8 encoding is buf.
+    @classmethod
+    def mapped(cls, buf: memoryview, nchars: int, crc: int) -> "ChunkedValue":
+        v = cls()
+        v.base = buf
+        v.length = nchars
+        v.crc = crc
+        v.joined = None
+        return v
+
+    def __len__(self):
+        return self.length
+
+    def loaded(self) -> bool:
+        return self.base is None
+
+    def load(self):
+        if self.base is not None:
+            self.chunks.insert(0, str(self.base, "utf-8", "surrogatepass"))
+            self.base = None
+
+    # The value's pieces as they are now: (base, segments, length, crc).
+    # The strings are immutable, so this stays valid after later appends.
+    def frozen(self) -> Tuple:
+        return self.base, self.chunks + self.tail, self.length, self.crc
+
+    def append(self, s: str):
+        if not s:
+            return
+        self.length += len(s)
+        self.crc = crc32(s, self.crc)
+        self.joined = None
+        if len(s) >= CHUNK_SIZE:
+            self.flush_tail()
+            self.chunks.append(s)
+        else:
+            self.tail.append(s)
+            if len(self.tail) >= TAIL_SEGMENTS:
+                self.flush_tail()
+
+    def flush_tail(self):
+        if not self.tail:
+            return
+        seg = "".join(self.tail)
+        self.tail.clear()
+        if self.chunks and len(self.chunks[-1]) < CHUNK_SIZE:
+            self.chunks[-1] += seg
+        else:
+            self.chunks.append(seg)
+
+    def value(self) -> str:
+        if self.joined is None:
+            self.load()
+            self.flush_tail()
+            self.joined = "".join(self.chunks)
+            self.chunks = [self.joined]
+        return self.joined
+
+    # The last n characters of the value.
+    def suffix(self, n: int) -> str:
+        if n <= 0:
+            return ""
+        if self.joined is not None:
+            return self.joined[-n:]
+        parts = []
+        need = n
+        for seg in reversed(self.chunks + self.tail):
+            if len(seg) >= need:
+                parts.append(seg[len(seg) - need:])
+                break
+            parts.append(seg)
+            need -= len(seg)
+        else:
+            if self.base is not None:
+                self.load()
+                return self.suffix(n)
+        parts.reverse()
+        return "".join(parts)
+
+def crc32(s: str, crc: int = 0) -> int:
+    return zlib.crc32(s.encode("utf-8", "surrogatepass"), crc)
+
+class Partition:
+    def __init__(self):
+        self.mu = threading.Lock()
+        self.data: Dict[str, ChunkedValue] = {}
+
+    # The *_locked methods expect the caller to hold self.mu.
+    def get_locked(self, key: str) -> str:
+        v = self.data.get(key)
+        return v.value() if v is not None else ""
+
+    def put_locked(self, key: str, value: str):
+        self.data[key] = ChunkedValue(value)
+
+    # Append value to key's value and return the updated ChunkedValue,
+    # without materializing the old value.
+    def extend_locked(self, key: str, value: str) -> ChunkedValue:
+        v = self.data.get(key)
+        if v is None:
+            v = ChunkedValue()
+            self.data[key] = v
+        v.append(value)
+        return v
+
+    # Append value to key's value and return the previous value
+    def append_locked(self, key: str, value: str) -> str:
+        v = self.data.get(key)
+        old = v.value() if v is not None else ""
+        self.extend_locked(key, value)
+        return old
+
+    # Like append_locked, but return only the previous value's length, its
+    # CRC-32 and its last ntail characters.
+    def append_summary_locked(self, key: str, value: str, ntail: int) -> Tuple[int, int, str]:
+        v = self.data.get(key)
+        summary = (len(v), v.crc, v.suffix(ntail)) if v is not None else (0, 0, "")
+        self.extend_locked(key, value)
+        return summary
+
+class ShardedStore:
+    def __init__(self, npartitions: int = NPARTITIONS):
+        if npartitions < 1:
+            raise ValueError(f"ShardedStore: need at least one partition, got {npartitions}")
+        self.partitions = [Partition() for _ in range(npartitions)]
+
+    def index(self, key: str) -> int:
+        return hash(key) % len(self.partitions)
+
+    def partition(self, key: str) -> Partition:
+        return self.partitions[self.index(key)]
+
+    def get(self, key: str) -> str:
+        p = self.partition(key)
+        with p.mu:
+            return p.get_locked(key)
+
+    def put(self, key: str, value: str):
+        p = self.partition(key)
+        with p.mu:
+            p.put_locked(key, value)
+
+    def append(self, key: str, value: str) -> str:
+        p = self.partition(key)
+        with p.mu:
+            return p.append_locked(key, value)
+
+    # Install a value, e.g. one loaded from a snapshot.
+    def load(self, key: str, value: ChunkedValue):
+        p = self.partition(key)
+        with p.mu:
+            p.data[key] = value
+
+    def __len__(self):
+        n = 0
+        for p in self.partitions:
+            with p.mu:
+                n += len(p.data)
+        return n
@@ -0,0 +1,80 @@
+import threading
+import unittest
+
+from storage import *
+
+class TestChunkedValue(unittest.TestCase):
+    def test_append(self):
+        v = ChunkedValue()
+        want = ""
+        for i in range(1000):
+            s = f"x {i} y"
+            v.append(s)
+            want += s
+            if i % 97 == 0:
+                self.assertEqual(v.value(), want)
+        self.assertEqual(len(v), len(want))
+        self.assertEqual(v.value(), want)
+
+    def test_bounded_segments(self):
+        v = ChunkedValue()
+        for _ in range(100000):
+            v.append("ab")
+        nsegs = len(v.chunks) + len(v.tail)
+        self.assertLessEqual(nsegs, len(v) // CHUNK_SIZE + 1 + TAIL_SEGMENTS)
+
+    def test_large_append(self):
+        v = ChunkedValue("a")
+        big = "b" * (CHUNK_SIZE + 1)
+        v.append(big)
+        v.append("c")
+        self.assertEqual(v.value(), "a" + big + "c")
+
+    def test_suffix_and_crc(self):
+        v = ChunkedValue("abc")
+        want = "abc"
+        for i in range(200):
+            s = f"-{i}" * (i % 7)
+            v.append(s)
+            want += s
+            for n in (0, 1, 5, 40, len(want), len(want) + 3):
+                self.assertEqual(v.suffix(n), want[-n:] if n > 0 else "")
+        self.assertEqual(v.crc, crc32(want))
+        v.value()
+        self.assertEqual(v.suffix(4), want[-4:])
+
+class TestShardedStore(unittest.TestCase):
+    def test_ops(self):
+        st = ShardedStore(4)
+        self.assertEqual(st.get("k"), "")
+        st.put("k", "a")
+        self.assertEqual(st.append("k", "b"), "a")
+        self.assertEqual(st.append("k2", "z"), "")
+        self.assertEqual(st.get("k"), "ab")
+        self.assertEqual(st.get("k2"), "z")
+        self.assertEqual(len(st), 2)
+
+    def test_concurrent_appends(self):
+        st = ShardedStore(8)
+        nthreads = 8
+        niters = 200
+
+        def worker(me):
+            for i in range(niters):
+                st.append("shared", f"x {me} {i} y")
+                st.append(f"own{me}", "x")
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(nthreads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        v = st.get("shared")
+        for me in range(nthreads):
+            lastoff = -1
+            for i in range(niters):
+                off = v.find(f"x {me} {i} y")
+                self.assertGreater(off, lastoff)
+                lastoff = off
+            self.assertEqual(st.get(f"own{me}"), "x" * niters)
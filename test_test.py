@@ -6,11 +6,16 @@ import threading
 from typing import Any, List, Tuple
 import unittest
 import queue
+import asyncio
 import base64
+import tempfile
+import zlib
 
 from porcupine.model import Operation
 from porcupine.porcupine import check_operations_verbose
 from models.kv import KvInput, KvOutput, KvModel
+from client import AsyncClerk
+from server import PutAppendArgs
 from config import make_single_config, make_shard_config, Config
 
 linearizability_check_timeout = 1  # in seconds
@@ -430,3 +435,213 @@ class TestRejection(unittest.TestCase):
 class TestUnreliableShards(unittest.TestCase):
     def test_unreliable_shards(self):
         generic_test(self, 5, (5, 3), True, False)
+
+# Test: compact appends report the old value's length, tail and CRC
+class TestCompactAppend(unittest.TestCase):
+    def test_compact_append(self):
+        cfg = make_single_config(self, False)
+        try:
+            ck = cfg.make_client()
+
+            cfg.begin("Test: compact append")
+
+            last = ""
+            for i in range(50):
+                nv = f"x 0 {i} y"
+                if i % 2 == 0:
+                    r = ck.append_compact("k", nv, tail=4, crc=True)
+                    self.assertEqual(r.prev_len, len(last))
+                    self.assertEqual(r.tail, last[-4:])
+                    self.assertEqual(r.prev_crc, zlib.crc32(last.encode()))
+                else:
+                    ov = ck.append("k", nv)
+                    self.assertEqual(ov, last)
+                last += nv
+
+            r = ck.append_compact("k", "z")
+            self.assertEqual(r.prev_len, len(last))
+            self.assertEqual(r.tail, "")
+            self.assertIsNone(r.prev_crc)
+            check(self, ck, "k", last + "z")
+        finally:
+            cfg.cleanup()
+            cfg.end()
+
+# Test: batched gets, puts and appends across shards
+class TestMulti(unittest.TestCase):
+    def test_multi(self):
+        cfg = make_shard_config(self, 3, 2, True)
+        try:
+            ck = cfg.make_client()
+
+            cfg.begin("Test: batched ops, sharded, unreliable net")
+
+            n = 30
+            ka = [str(i) for i in range(n)]
+            va = [randstring(20) for i in range(n)]
+            ck.put_many(zip(ka, va))
+            for i in range(n):
+                check(self, ck, ka[i], va[i])
+
+            olds = ck.append_many([(k, "x") for k in ka] + [(ka[0], "y")])
+            self.assertEqual(olds, va + [va[0] + "x"])
+
+            want = [v + "x" for v in va]
+            want[0] += "y"
+            self.assertEqual(ck.get_many(ka + ["missing"]), want + [""])
+
+            # one RPC per shard, give or take retries
+            rpcs = cfg.rpc_total()
+            ck.get_many(ka)
+            self.assertLessEqual(cfg.rpc_total() - rpcs, 3 * 3)
+        finally:
+            cfg.cleanup()
+            cfg.end()
+
+# Test: one AsyncClerk with many operations in flight, unreliable net
+class TestAsyncClerk(unittest.TestCase):
+    def test_async_clerk(self):
+        cfg = make_shard_config(self, 3, 2, True)
+        try:
+            ck = cfg.make_client(AsyncClerk)
+
+            cfg.begin("Test: async clerk, sharded, unreliable net")
+
+            nkeys = 20
+            upto = 20
+
+            async def run():
+                ops = []
+                for j in range(upto):
+                    for k in range(nkeys):
+                        ops.append(ck.append(str(k), f"x {k} {j} y"))
+                olds = await asyncio.gather(*ops)
+                values = await asyncio.gather(*[ck.get(str(k)) for k in range(nkeys)])
+                return olds, values
+
+            olds, values = asyncio.run(run())
+
+            for k in range(nkeys):
+                # appends to one key apply in the order they were issued
+                check_clnt_appends(self, k, values[k], upto)
+                self.assertEqual(len(values[k]), sum(len(f"x {k} {j} y") for j in range(upto)))
+            for i, ov in enumerate(olds):
+                k, j = i % nkeys, i // nkeys
+                self.assertEqual(ov, "".join(f"x {k} {jj} y" for jj in range(j)))
+        finally:
+            cfg.cleanup()
+            cfg.end()
+
+# Test: reads hedge around a replica that is slow to fail
+class TestHedgedReads(unittest.TestCase):
+    def test_hedged_reads(self):
+        cfg = make_shard_config(self, 3, 3, False)
+        try:
+            ck = cfg.make_client()
+
+            cfg.begin("Test: hedged reads")
+
+            n = 10
+            ka = [str(i) for i in range(n)]
+            va = [randstring(20) for i in range(n)]
+            ck.put_many(zip(ka, va))
+
+            # RPCs to a stopped server take up to 7 seconds to fail. With
+            # no latency samples yet, the first read goes to the primary.
+            cfg.net.long_delays(True)
+            cfg.stop_server(ck.group(ka[0])[0])
+
+            t0 = time.time()
+            for i in range(n):
+                check(self, ck, ka[i], va[i])
+            if time.time() - t0 > 5:
+                self.fail("hedged reads waited for the stopped replica")
+            self.assertGreater(ck.nhedges, 0)
+            self.assertGreater(ck.hedge_rate(), 0)
+        finally:
+            cfg.cleanup()
+            cfg.end()
+
+# Test: servers recover their data from the write-ahead log after a restart
+class TestPersistence(unittest.TestCase):
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as d:
+            cfg = make_shard_config(self, 3, 2, False, persist_dir=d)
+            try:
+                ck = cfg.make_client()
+
+                cfg.begin("Test: restart with write-ahead log")
+
+                n = 10
+                ka = [str(i) for i in range(n)]
+                va = [randstring(20) for i in range(n)]
+                ck.put_many(zip(ka, va))
+
+                def client_func(me, myck, t):
+                    for j in range(20):
+                        append(cfg, myck, ka[me], f"x {me} {j} y", None, -1)
+
+                spawn_clients_and_wait(self, cfg, n, client_func)
+
+                for srvid in range(3):
+                    cfg.restart_server(srvid)
+                for i in range(n):
+                    v = ck.get(ka[i])
+                    self.assertTrue(v.startswith(va[i]))
+                    check_clnt_appends(self, i, v, 20)
+
+                # the restarted servers still know which appends they executed
+                old = ck.get(ka[0])
+                args = PutAppendArgs(ka[0], "dup")
+                ck.write(ka[0], "KVServer.Append", args)
+                srvid = ck.group(ka[0])[0]
+                cfg.restart_server(srvid)
+                reply = cfg.kvservers[srvid].Append(args)
+                self.assertEqual(reply.value, old)
+                check(self, ck, ka[0], old + "dup")
+            finally:
+                cfg.cleanup()
+                cfg.end()
+
+class TestSnapshot(unittest.TestCase):
+    def test_snapshot(self):
+        with tempfile.TemporaryDirectory() as d:
+            cfg = make_shard_config(self, 3, 2, False, persist_dir=d)
+            try:
+                ck = cfg.make_client()
+
+                cfg.begin("Test: restart from snapshot and log")
+
+                n = 10
+                ka = [str(i) for i in range(n)]
+                va = [randstring(20) for i in range(n)]
+                ck.put_many(zip(ka, va))
+                for kv in cfg.kvservers:
+                    kv.snapshot()
+                for i in range(1, n):
+                    ck.append(ka[i], "x")
+                va = [va[0]] + [v + "x" for v in va[1:]]
+
+                for srvid in range(3):
+                    cfg.restart_server(srvid)
+                    self.assertEqual(os.listdir(d).count(f"kvserver-{srvid}-1.wal"), 1)
+                    self.assertEqual(os.listdir(d).count(f"kvserver-{srvid}-0.wal"), 0)
+
+                # values come back from the snapshot undecoded
+                kv = cfg.kvservers[ck.group(ka[0])[0]]
+                self.assertFalse(kv.store.partition(ka[0]).data[ka[0]].loaded())
+                for i in range(n):
+                    check(self, ck, ka[i], va[i])
+
+                # snapshots taken in the background once the log grows
+                cfg.snapshot_bytes = 1000
+                for j in range(50):
+                    ck.append(ka[j % n], "y" * 20)
+                for srvid in range(3):
+                    cfg.restart_server(srvid)
+                    self.assertGreater(cfg.kvservers[srvid].wal_gen, 1)
+                for i in range(n):
+                    check(self, ck, ka[i], va[i] + "y" * 100)
+            finally:
+                cfg.cleanup()
+                cfg.end()
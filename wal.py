@@ -0,0 +1,197 @@
+import os
+import struct
+import threading
+import zlib
+from typing import Iterator, List, Tuple
+
+# Operation codes in log records.
+OpPut = 1
+OpAppend = 2
+OpMultiPut = 3
+OpMultiAppend = 4
+
+# Flags for OpAppend records, mirroring PutAppendArgs.
+FlagCompact = 1
+FlagCrc = 2
+
+# Record layout, little-endian:
+#
+#   frame:  u32 body length, u32 CRC-32 of body, body
+#   body:   u8 op, u64 client id, u64 seq, u8 flags, u32 tail, u32 npairs,
+#           then npairs times: u32 key length, key, u32 value length, value
+#
+# Keys and values are UTF-8. A frame that is cut short or fails its CRC
+# marks the end of the log; anything after it is discarded on replay.
+FRAME = struct.Struct("<II")
+HEADER = struct.Struct("<BQQBII")
+LEN = struct.Struct("<I")
+
+class Record:
+    def __init__(self, op: int, client_id: int, seq: int, pairs: List[Tuple[str, str]], flags: int = 0, tail: int = 0):
+        self.op = op
+        self.client_id = client_id
+        self.seq = seq
+        self.pairs = pairs  # (key, value) in the order they were applied
+        self.flags = flags
+        self.tail = tail
+
+def encode_record(rec: Record) -> bytes:
+    parts = [HEADER.pack(rec.op, rec.client_id, rec.seq, rec.flags, rec.tail, len(rec.pairs))]
+    for key, value in rec.pairs:
+        kb = key.encode("utf-8", "surrogatepass")
+        vb = value.encode("utf-8", "surrogatepass")
+        parts += [LEN.pack(len(kb)), kb, LEN.pack(len(vb)), vb]
+    body = b"".join(parts)
+    return FRAME.pack(len(body), zlib.crc32(body)) + body
+
+def decode_body(body: bytes) -> Record:
+    op, client_id, seq, flags, tail, npairs = HEADER.unpack_from(body, 0)
+    off = HEADER.size
+    pairs = []
+    for _ in range(npairs):
+        (n,) = LEN.unpack_from(body, off)
+        key = body[off + LEN.size:off + LEN.size + n].decode("utf-8", "surrogatepass")
+        off += LEN.size + n
+        (n,) = LEN.unpack_from(body, off)
+        value = body[off + LEN.size:off + LEN.size + n].decode("utf-8", "surrogatepass")
+        off += LEN.size + n
+        pairs.append((key, value))
+    return Record(op, client_id, seq, pairs, flags, tail)
+
+# Read the records of the log at path, starting at byte offset start.
+# Yields (record, offset just past it).
+def read_records(path: str, start: int = 0) -> Iterator[Tuple[Record, int]]:
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        f.seek(start)
+        off = start
+        while True:
+            hdr = f.read(FRAME.size)
+            if len(hdr) < FRAME.size:
+                return
+            n, crc = FRAME.unpack(hdr)
+            body = f.read(n)
+            if len(body) < n or zlib.crc32(body) != crc:
+                return
+            off += FRAME.size + n
+            yield decode_body(body), off
+
+# An append-only log of applied writes. append() only buffers a record and
+# returns its log sequence number; wait(lsn) returns once that record is on
+# disk. Appends after close() are dropped and return 0.
+#
+# With group_commit, a committer thread writes everything buffered so far
+# with a single write and fsync, so writers that arrive while an fsync is in
+# progress share the next one. Without it, every append writes and fsyncs
+# on its own.
+class WriteAheadLog:
+    def __init__(self, path: str, group_commit: bool = True, fsync: bool = True):
+        self.path = path
+        self.group_commit = group_commit
+        self.fsync = fsync
+
+        # drop a torn or corrupt tail left by a crash
+        end = 0
+        for _, end in read_records(path):
+            pass
+        self.f = open(path, "ab")
+        if self.f.tell() != end:
+            self.f.truncate(end)
+        self.size = end  # bytes in the log, including buffered records
+
+        self.io_mu = threading.Lock()  # held while writing to self.f; taken before mu
+        self.mu = threading.Lock()
+        self.cond = threading.Condition(self.mu)
+        self.pending: List[bytes] = []  # encoded records not yet written
+        self.appended = 0  # lsn of the last appended record
+        self.durable = 0  # lsn of the last record known to be on disk
+        self.nsyncs = 0
+        self.closed = False
+
+        if group_commit:
+            self.committer = threading.Thread(target=self.run_committer, daemon=True)
+            self.committer.start()
+
+    def append(self, rec: Record) -> int:
+        data = encode_record(rec)
+        if self.group_commit:
+            return self.buffer(data)
+        with self.io_mu:
+            lsn = self.buffer(data)
+            self.flush_pending()
+        return lsn
+
+    def buffer(self, data: bytes) -> int:
+        with self.mu:
+            if self.closed:
+                return 0  # the server has crashed; the record is lost
+            self.appended += 1
+            self.size += len(data)
+            self.pending.append(data)
+            self.cond.notify_all()
+            return self.appended
+
+    def wait(self, lsn: int):
+        with self.mu:
+            while self.durable < lsn:
+                self.cond.wait()
+
+    def write_sync(self, data: bytes):
+        self.f.write(data)
+        self.f.flush()
+        if self.fsync:
+            os.fsync(self.f.fileno())
+        self.nsyncs += 1
+
+    def run_committer(self):
+        while True:
+            with self.mu:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if not self.pending and self.closed:
+                    return
+            with self.io_mu:
+                self.flush_pending()
+
+    # Write and sync the buffered records. The caller holds io_mu.
+    def flush_pending(self):
+        with self.mu:
+            data = b"".join(self.pending)
+            self.pending = []
+            upto = self.appended
+        if data:
+            self.write_sync(data)
+        with self.mu:
+            self.durable = max(self.durable, upto)
+            self.cond.notify_all()
+
+    # Make everything appended so far durable in the current file and
+    # continue the log in a new file at path.
+    def rotate(self, path: str):
+        with self.io_mu:
+            if self.closed:
+                return
+            self.flush_pending()
+            self.f.close()
+            self.f = open(path, "ab")
+            with self.mu:
+                self.path = path
+                self.size = self.f.tell()
+
+    # Flush what has been appended and stop the committer.
+    def close(self):
+        with self.mu:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify_all()
+        if self.group_commit:
+            self.committer.join()
+        with self.mu:
+            self.durable = self.appended
+            self.cond.notify_all()
+        with self.io_mu:
+            self.f.close()
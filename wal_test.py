@@ -0,0 +1,76 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from wal import *
+
+class TestWAL(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "test.wal")
+
+    def test_roundtrip(self):
+        recs = [
+            Record(OpPut, 1, 1, [("k", "v")]),
+            Record(OpAppend, 1, 2, [("k", "éx")], FlagCompact | FlagCrc, 7),
+            Record(OpMultiAppend, 2, 1, [("a", "1"), ("b", ""), ("a", "2")]),
+        ]
+        log = WriteAheadLog(self.path)
+        for rec in recs:
+            log.wait(log.append(rec))
+        log.close()
+
+        got = [rec for rec, _ in read_records(self.path)]
+        self.assertEqual(len(got), len(recs))
+        for a, b in zip(got, recs):
+            self.assertEqual(vars(a), vars(b))
+
+    def test_torn_tail(self):
+        log = WriteAheadLog(self.path)
+        for i in range(10):
+            log.append(Record(OpAppend, 1, i + 1, [("k", str(i))]))
+        log.close()
+
+        # cut the last record short, then append after reopening
+        size = os.path.getsize(self.path)
+        with open(self.path, "r+b") as f:
+            f.truncate(size - 3)
+        log = WriteAheadLog(self.path)
+        log.wait(log.append(Record(OpPut, 1, 11, [("k", "new")])))
+        log.close()
+
+        got = [rec.pairs[0][1] for rec, _ in read_records(self.path)]
+        self.assertEqual(got, [str(i) for i in range(9)] + ["new"])
+
+    def test_group_commit(self):
+        log = WriteAheadLog(self.path, group_commit=True)
+        nthreads = 8
+        niters = 50
+
+        def writer(me):
+            for i in range(niters):
+                log.wait(log.append(Record(OpAppend, me, i + 1, [(str(me), "x")])))
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(nthreads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        nsyncs = log.nsyncs
+        log.close()
+
+        self.assertEqual(len(list(read_records(self.path))), nthreads * niters)
+        self.assertLess(nsyncs, nthreads * niters)
+
+    def test_rotate(self):
+        log = WriteAheadLog(self.path)
+        log.append(Record(OpPut, 1, 1, [("k", "a")]))
+        path2 = os.path.join(self.dir.name, "test2.wal")
+        log.rotate(path2)
+        log.wait(log.append(Record(OpPut, 1, 2, [("k", "b")])))
+        log.close()
+
+        self.assertEqual([rec.seq for rec, _ in read_records(self.path)], [1])
+        self.assertEqual([rec.seq for rec, _ in read_records(path2)], [2])